@@ -16,7 +16,11 @@ sales = ss["sales"].data
 cb = ss["cashbook"].cashbook
 
 # Get volume pct
-vol = sales.groupby("Purity Category").agg({"Gross Weight": "sum"}).reset_index()
+vol = (
+    sales.groupby("Purity Category", observed=True)
+    .agg({"Gross Weight": "sum"})
+    .reset_index()
+)
 vol["Percent"] = round(vol["Gross Weight"] / vol["Gross Weight"].sum(), 2)
 vol
 
@@ -108,7 +108,7 @@ class Analytics:
                 & (cashbook["Sub-Category"] != "Loans")
                 & (cashbook["Super-Category"] != "Rent")
             ]
-            .groupby(["Super-Category", "Sub-Category", "Cost Type"])
+            .groupby(["Super-Category", "Sub-Category", "Cost Type"], observed=True)
             .aggregate({"Debit": "sum"})
             .reset_index()
         )
@@ -132,7 +132,10 @@ class Analytics:
         Generates pie chart data of the expense categories.
         """
         cashbook = cashbookReader.cashbook
-        cashbook = cashbook[cashbook["Cost Type"] == "VARIABLE"].copy()
+        cashbook = cashbook[cashbook["Cost Type"] == "VARIABLE"].astype(
+            # px.sunburst cannot build its hierarchy from categoricals
+            {"Category": str, "Super-Category": str, "Sub-Category": str}
+        )
 
         cashbook.sort_values(by=["Cost Type", "Debit"], ascending=False, inplace=True)
 
@@ -140,7 +143,7 @@ class Analytics:
 
     @staticmethod
     def monthly_sales_data(df: pd.DataFrame):
-        df = df.groupby(["Month", "Purity Category"]).agg(
+        df = df.groupby(["Month", "Purity Category"], observed=True).agg(
             {"Gross Weight": "sum", "Pure Weight": "sum", "Making Value": "sum"}
         )
 
@@ -163,7 +166,7 @@ class Analytics:
         """
         # ----- Transform the data ----- #
         df = (
-            df.groupby(["Purity Category", "Item Category", "Item Code"])
+            df.groupby(["Purity Category", "Item Category", "Item Code"], observed=True)
             .agg(
                 {
                     "Gross Weight": "sum",
@@ -186,7 +189,7 @@ class Analytics:
         """
         df = (
             sales[sales["Purity Category"] == category]
-            .groupby("Day")
+            .groupby("Day", observed=True)
             .agg({"Making Value": "sum", "Gross Weight": "sum"})
             .reset_index()
             .sort_values(by="Day", ascending=True)
@@ -23,7 +23,7 @@ class Components:
             pd.DataFrame: A styled DataFrame with aggregated sales data.
         """
         return (
-            df.groupby(colnames)
+            df.groupby(colnames, observed=True)
             .agg(
                 {
                     "Gross Weight": "sum",
@@ -58,7 +58,7 @@ class Components:
             df (pd.DataFrame): The DataFrame containing sales data.
             col (str): The column name to calculate the monthly metric for.
         """
-        monthly = df.groupby("Month").agg({col: "sum"})
+        monthly = df.groupby("Month", observed=True).agg({col: "sum"})
         # Exclude current month if it is not complete
         if datetime.now().strftime("%Y-%m") == monthly.index[-1]:
             monthly = monthly[:-1]
@@ -97,7 +97,7 @@ class Components:
             with c:
                 try:
                     driver = (
-                        df.groupby("Item Category")
+                        df.groupby("Item Category", observed=True)
                         .agg({"Gross Weight": "sum", "Making Value": "sum"})
                         .sort_values(by="Making Value", ascending=False)
                         .reset_index()
@@ -153,6 +153,9 @@ class Components:
                 fig = Plots.rolling_purity_performance(df, item=ss.item_rolling)
                 st.plotly_chart(fig, use_container_width=True)
 
+        # Shared by the volume and revenue month-wise charts
+        monthly = Analytics.monthly_sales_data(df)
+
         tabs = st.tabs(["Volume Analysis", "Revenue Analysis"])
         with tabs[0]:
             # Section 1: Volume
@@ -162,9 +165,7 @@ class Components:
                 # Section 1.1: Monthly Sales & Breakdown
                 q, k = st.columns([1, 1])
                 with q:
-                    fig2 = Plots.monthwise_sales(
-                        Analytics.monthly_sales_data(df), y="Gross Weight"
-                    )
+                    fig2 = Plots.monthwise_sales(monthly, y="Gross Weight")
                     st.plotly_chart(fig2, use_container_width=True, key="mg")
                 with k:
                     try:
@@ -184,7 +185,7 @@ class Components:
                 # Section 2.1:  Monthly sales & breakdown
                 q, k = st.columns([1, 1])
                 with q:
-                    fig = Plots.monthwise_sales(Analytics.monthly_sales_data(df))
+                    fig = Plots.monthwise_sales(monthly)
                     st.plotly_chart(fig, use_container_width=True)
                 with k:
                     try:
@@ -1,15 +1,21 @@
 from enum import Enum
-from typing import List
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 import pandas as pd
+import numpy as np
 import logging
 import streamlit as st
-from scipy.signal import savgol_filter
 from datetime import datetime
+import importlib.util
+from scipy.signal import savgol_coeffs
 
 from src.backend.analytics import Analytics
 
+# Serialize figures with orjson (C-level NumPy encoding) when it is installed
+if importlib.util.find_spec("orjson") is not None:
+    pio.json.config.default_engine = "orjson"
+
 
 class Color(Enum):
     """
@@ -31,7 +37,61 @@ class Color(Enum):
     K9 = "#02b013"
 
 
+# Plain string constants, so plot builders skip the Enum attribute lookups
+OLIVE_GREEN = Color.OLIVE_GREEN.value
+DARK_GREY = Color.DARK_GREY.value
+DARK_RED = Color.DARK_RED.value
+RED = Color.RED.value
+BLACK = Color.BLACK.value
+GREEN1 = Color.GREEN1.value
+GREEN2 = Color.GREEN2.value
+GREEN3 = Color.GREEN3.value
+OCEAN_BLUE = Color.OCEAN_BLUE.value
+K18 = Color.K18.value
+K22 = Color.K22.value
+K21 = Color.K21.value
+K9 = Color.K9.value
+
+PASTEL = px.colors.qualitative.Pastel
+
+# Plot data and figures are cached per set of arguments, which every filter
+# combination changes, so each function keeps a bounded number of entries for
+# a limited time. Cached values are returned as copies, so a figure updated by
+# one session does not leak into another
+CACHE_OPTIONS = dict(show_spinner=False, max_entries=16, ttl="1h")
+
+# Savitzky-Golay smoothing of the weekly gross weight line
+SAVGOL_WINDOW = 10
+SAVGOL_ORDER = 2
+PURITY_COLORS = {
+    "18K": K18,
+    "21K": K21,
+    "22K": K22,
+    "9K": K9,
+}
+
+
 class Plots:
+    # Plotted values are shown to 2 decimals, so single precision suffices
+    _float32_columns = [
+        "Gross Weight",
+        "Pure Weight",
+        "Making Value",
+        "Making Rate",
+        "Item Weight",
+        "Gold Gains",
+    ]
+    # scipy.signal.windows.triang(4), normalized
+    _triang_weights = np.array([1, 3, 3, 1]) / 8
+    # Savitzky-Golay smoothing coefficients, computed once: for the centre of a
+    # window, and for each point of the edge windows
+    _savgol_centre = savgol_coeffs(SAVGOL_WINDOW, SAVGOL_ORDER, use="dot")
+    _savgol_edges = np.array(
+        [
+            savgol_coeffs(SAVGOL_WINDOW, SAVGOL_ORDER, pos=pos, use="dot")
+            for pos in range(SAVGOL_WINDOW)
+        ]
+    )
 
     @staticmethod
     def profit_loss_barchart(monthly_data: pd.DataFrame, convert_gold=False) -> None:
@@ -62,8 +122,8 @@ class Plots:
             y="Profit",
             color="Direction",
             color_discrete_map={
-                "Net Profit": Color.GREEN1.value,
-                "Net Loss": Color.DARK_RED.value,
+                "Net Profit": GREEN1,
+                "Net Loss": DARK_RED,
             },
             text="Profit",
             title="Monthly Profit and Loss",
@@ -123,8 +183,8 @@ class Plots:
             go.Bar(
                 y=monthly_data["Total Income"],
                 name="Making Charges",
-                marker_color=Color.GREEN1.value,
-                text=monthly_data["Total Income"].apply(lambda x: f"{x:,.2f} AED"),
+                marker_color=GREEN1,
+                texttemplate="%{y:,.2f} AED",
                 hovertemplate=("Month: %{x}<br>" + "Making Charges: %{y:,.2f} AED<br>"),
             )
         )
@@ -135,8 +195,8 @@ class Plots:
                 go.Bar(
                     y=monthly_data["Gold Gains"],
                     name="Gold Gains",
-                    marker_color=Color.GREEN3.value,
-                    text=monthly_data["Gold Gains"].apply(lambda x: f"{x:,.2f} AED"),
+                    marker_color=GREEN3,
+                    texttemplate="%{y:,.2f} AED",
                     hovertemplate=("Month: %{x}<br>" + "Gold Gains: %{y:,.2f} AED<br>"),
                 )
             )
@@ -146,8 +206,8 @@ class Plots:
             go.Bar(
                 y=monthly_data["Total Cost"],
                 name="Total Cost",
-                marker_color=Color.DARK_RED.value,
-                text=monthly_data["Total Cost"].apply(lambda x: f"{x:,.2f} AED"),
+                marker_color=DARK_RED,
+                texttemplate="%{y:,.2f} AED",
                 hovertemplate=("Month: %{x}<br>" + "Total Expenses: %{y:,.2f} AED<br>"),
             )
         )
@@ -161,7 +221,7 @@ class Plots:
                 y=profit,
                 mode="lines+markers",
                 name="Net Profit",
-                line=dict(color=Color.DARK_GREY.value, width=2),
+                line=dict(color=DARK_GREY, width=2),
                 hovertemplate=("Month: %{x}<br>" + "Net Profit: %{y:,.2f} AED<br>"),
             )
         )
@@ -172,9 +232,9 @@ class Plots:
         # Common line args
         kwargs = {
             "line_dash": "dash",
-            "line_color": Color.BLACK.value,
+            "line_color": BLACK,
             "annotation_position": "top left",
-            "annotation_font_color": Color.BLACK.value,
+            "annotation_font_color": BLACK,
             "opacity": 0.2,
         }
 
@@ -248,7 +308,7 @@ class Plots:
             title=" ",
             values="Debit",
             color="Super-Category" if not variable else "Sub-Category",
-            color_discrete_sequence=px.colors.qualitative.Pastel,
+            color_discrete_sequence=PASTEL,
             hover_data={"Super-Category": False, "Sub-Category": False, "Debit": False},
         )
 
@@ -273,13 +333,183 @@ class Plots:
         return fig
 
     @staticmethod
-    def _purity_color_map():
-        return {
-            "18K": Color.K18.value,
-            "21K": Color.K21.value,
-            "22K": Color.K22.value,
-            "9K": Color.K9.value,
-        }
+    def _downcast(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns a copy of `df` with its float64 value columns cast to float32.
+
+        Args:
+            df (pd.DataFrame): DataFrame containing sales data.
+
+        Returns:
+            pd.DataFrame: The downcast DataFrame.
+        """
+        return df.astype(
+            {
+                col: np.float32
+                for col in Plots._float32_columns
+                if col in df.columns and df[col].dtype == np.float64
+            }
+        )
+
+    @staticmethod
+    @st.cache_data(**CACHE_OPTIONS)
+    def _sales_only(sales: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns the sale records of `sales`, shared between the plots that
+        only consider sales.
+
+        Args:
+            sales (pd.DataFrame): DataFrame containing sales data.
+
+        Returns:
+            pd.DataFrame: The sale records.
+        """
+        # Categorical equality compares the integer codes
+        return sales.loc[(sales["Transaction Type"] == "SALE").to_numpy()]
+
+    @staticmethod
+    def _selection_mask(
+        sales: pd.DataFrame, item_category=None, purity=None
+    ) -> np.ndarray:
+        """
+        Builds a single boolean mask restricting records to an item category
+        and/or purity.
+
+        Args:
+            sales (pd.DataFrame): DataFrame containing sales data.
+            item_category (str): The item category to keep. Defaults to None.
+            purity (str): The purity category to keep. Defaults to None.
+
+        Returns:
+            np.ndarray: Boolean mask aligned with `sales`.
+        """
+        mask = np.ones(len(sales), dtype=bool)
+        if item_category:
+            mask &= (sales["Item Category"] == item_category).to_numpy()
+        if purity:
+            mask &= (sales["Purity Category"] == purity).to_numpy()
+        return mask
+
+    @staticmethod
+    @st.cache_data(**CACHE_OPTIONS)
+    def _weekly_making_value(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Aggregates the positive making charges of sale records per week.
+
+        Args:
+            df (pd.DataFrame): DataFrame containing sales data.
+
+        Returns:
+            pd.DataFrame: Weekly making value, with its month.
+        """
+        # Only gather the needed columns; Month and Week are precomputed
+        mask = (df["Transaction Type"] == "SALE") & (df["Making Value"] > 0)
+        return (
+            Plots._downcast(df.loc[mask, ["Month", "Week", "Making Value"]])
+            .groupby(["Month", "Week"], observed=True, sort=False)
+            .agg({"Making Value": "sum"})
+            .reset_index()
+        )
+
+    @staticmethod
+    @st.cache_data(**CACHE_OPTIONS)
+    def _weekly_gross_weight(sales: pd.DataFrame) -> pd.DataFrame:
+        """
+        Resamples gross weight to weekly totals with a triangular rolling average.
+
+        Args:
+            sales (pd.DataFrame): DataFrame containing sales data.
+
+        Returns:
+            pd.DataFrame: Weekly gross weight and its rolling average.
+        """
+        weekly = (
+            sales.resample("W", on="Date").agg({"Gross Weight": "sum"}).reset_index()
+        )
+        # 4-week triangular mean, i.e. rolling(window=4, win_type="triang"),
+        # as a single convolution; the leading weeks are back-filled
+        totals = weekly["Gross Weight"].to_numpy(dtype=np.float64)
+        rolling = np.full(len(totals), np.nan)
+        if len(totals) >= len(Plots._triang_weights):
+            window = len(Plots._triang_weights)
+            rolling[window - 1 :] = np.convolve(totals, Plots._triang_weights, "valid")
+            rolling[: window - 1] = rolling[window - 1]
+        weekly["RollingAvg"] = rolling
+        return weekly
+
+    @staticmethod
+    def _savgol(values: np.ndarray) -> np.ndarray:
+        """
+        Smooths `values`; equivalent to `scipy.signal.savgol_filter(values,
+        SAVGOL_WINDOW, SAVGOL_ORDER)` with its default "interp" edge handling.
+
+        Args:
+            values (np.ndarray): The values to smooth.
+
+        Returns:
+            np.ndarray: The smoothed values.
+        """
+        window = SAVGOL_WINDOW
+        if len(values) < window:
+            raise ValueError(f"At least {window} values are required to smooth.")
+        half = window // 2
+        smoothed = np.empty(len(values))
+        start = (window - 1) // 2
+        smoothed[start : len(values) - window + 1 + start] = np.correlate(
+            values, Plots._savgol_centre, "valid"
+        )
+        # Edges are taken from the fit over the first and last windows
+        smoothed[:half] = Plots._savgol_edges[:half] @ values[:window]
+        smoothed[-half:] = Plots._savgol_edges[half:] @ values[-window:]
+        return smoothed
+
+    @staticmethod
+    def _weighted_median(values: np.ndarray, weights: np.ndarray) -> float:
+        """
+        Computes the median of `values` with each value repeated `weights`
+        times, without materializing the repetitions.
+
+        Args:
+            values (np.ndarray): The values.
+            weights (np.ndarray): The (positive integer) repeat counts.
+
+        Returns:
+            float: The weighted median.
+        """
+        order = np.argsort(values)
+        values, cumulative = values[order], np.cumsum(weights[order])
+        total = cumulative[-1]
+        # Middle element(s) of the expanded, sorted values
+        lower = values[np.searchsorted(cumulative, (total - 1) // 2, side="right")]
+        upper = values[np.searchsorted(cumulative, total // 2, side="right")]
+        return (lower + upper) / 2
+
+    @staticmethod
+    @st.cache_data(**CACHE_OPTIONS)
+    def _weekly_median_item_weight(data: pd.DataFrame) -> pd.DataFrame:
+        """
+        Computes the weekly median per-unit item weight of each item category,
+        weighting each record by its unit quantity.
+
+        Args:
+            data (pd.DataFrame): DataFrame containing sales data.
+
+        Returns:
+            pd.DataFrame: Median item weight by item category, month and week.
+        """
+        data = data[(data["Unit Quantity"] > 0) & data["Item Weight"].notna()]
+        return (
+            data.groupby(["Item Category", "Month", "Week"], observed=True, sort=False)[
+                ["Item Weight", "Unit Quantity"]
+            ]
+            .apply(
+                lambda g: Plots._weighted_median(
+                    g["Item Weight"].to_numpy(), g["Unit Quantity"].to_numpy()
+                )
+            )
+            .rename("Item Weight")
+            .reset_index()
+        )
 
     @staticmethod
     def sales_sunburst(sales: pd.DataFrame, y: str = "Making Value") -> None:
@@ -290,16 +520,33 @@ class Plots:
             sales (pd.DataFrame): DataFrame containing sales data.
         """
 
+        # ----- Transform the data ----- #
+        # Roll up explicitly: purities at the root ring, item categories below
+        items = (
+            sales.groupby(
+                ["Purity Category", "Item Category"], observed=True, sort=False
+            )[y]
+            .sum()
+            .reset_index()
+        )
+        purities = items.groupby("Purity Category", observed=True, sort=False)[y].sum()
+        parents = items["Purity Category"].astype(str).tolist()
+        roots = purities.index.astype(str).tolist()
+        labels = items["Item Category"].astype(str).tolist()
+
         # ----- Plotting ----- #
-        fig = px.sunburst(
-            sales,
-            path=["Purity Category", "Item Category"],
-            values=y,
-            color="Purity Category",
-            color_discrete_map=Plots._purity_color_map(),
-            width=800,
-            height=600,
+        fig = go.Figure(
+            go.Sunburst(
+                ids=[f"{parent}/{label}" for parent, label in zip(parents, labels)]
+                + roots,
+                labels=labels + roots,
+                parents=parents + [""] * len(roots),
+                values=np.concatenate([items[y].to_numpy(), purities.to_numpy()]),
+                branchvalues="total",
+                marker=dict(colors=[PURITY_COLORS.get(p) for p in parents + roots]),
+            )
         )
+        fig.update_layout(width=800, height=600)
 
         # Formatting
         fig.update_traces(
@@ -317,6 +564,7 @@ class Plots:
         return fig
 
     @staticmethod
+    @st.cache_data(**CACHE_OPTIONS)
     def monthwise_sales(sales: pd.DataFrame, y: str = "Making Value") -> None:
         """
         Generates a month-wise sales chart by purity using Streamlit.
@@ -326,40 +574,46 @@ class Plots:
         """
 
         # ----- Plotting ----- #
-        fig = px.bar(
-            sales,
-            x=sales.Month,
-            y=sales[y],
-            color=sales["Purity Category"],
-            custom_data=["Purity Category"],
-            color_discrete_map=Plots._purity_color_map(),
+        # One stacked bar trace per purity
+        fig = go.Figure()
+        for purity, group in sales.groupby("Purity Category", observed=True):
+            fig.add_trace(
+                go.Bar(
+                    x=group["Month"].to_numpy(),
+                    y=group[y].to_numpy(),
+                    name=purity,
+                    marker_color=PURITY_COLORS.get(purity),
+                    customdata=np.full((len(group), 1), purity, dtype=object),
+                )
+            )
+        fig.update_layout(
             # title="Monthly Sales by Purity",
             barmode="stack",
             height=600,
             width=800,
         )
 
-        # Average sales
-        avg = sales.groupby(sales.Month).agg({y: "sum"})
-        # Exclude latest month if it is incomplete
+        # Monthly totals
+        months, uniques = pd.factorize(sales["Month"].to_numpy())
+        totals = np.bincount(months, weights=sales[y].to_numpy(dtype=np.float64))
+
+        # Average sales, excluding the current month as it is incomplete
         this_month = datetime.now().strftime("%Y-%m")
-        if sales.Month.max() == this_month:
-            avg = avg[avg.index != this_month]
-        avg = avg[y].mean()
+        avg = totals[uniques != this_month].mean()
 
         fig.add_hline(
             y=avg,
             line_dash="dash",
-            line_color=Color.BLACK.value,
+            line_color=BLACK,
             annotation_text=f"Average: {avg:,.2f} AED",
             annotation_position="top right",
-            annotation_font_color=Color.BLACK.value,
+            annotation_font_color=BLACK,
             opacity=0.2,
         )
 
         base_ymax = 130000
         base_ythresh = 100000
-        sales_max = sales.groupby(sales.Month).agg({y: "sum"})[y].max() * 1.2
+        sales_max = totals.max() * 1.2
 
         kwargs = {
             "showspikes": True,
@@ -408,26 +662,15 @@ class Plots:
         """
 
         # ----- Plotting ----- #
-        data = df[df["Transaction Type"] == "SALE"].copy()
-        data["Month"] = data.Date.dt.to_period("M").astype(str)
-        data["Week"] = data.Date.dt.to_period("W")
-        data = (
-            data[data["Making Value"] > 0]
-            .groupby(["Month", "Week"])
-            .agg({"Making Value": "sum"})
-            .reset_index()
-        )
-        data.columns = ["Month", "Week", "Making Value"]
-
         fig = px.box(
-            data,
+            Plots._weekly_making_value(df),
             x="Month",
             y="Making Value",
             title="Weekly Making Charges by Month",
             labels={"Month": "Month", "Making Value": "Making Charges (AED)"},
             width=800,
             height=600,
-            color_discrete_sequence=[Color.OCEAN_BLUE.value],
+            color_discrete_sequence=[OCEAN_BLUE],
         )
 
         # Uncomment below to remove inside fill color
@@ -446,6 +689,7 @@ class Plots:
         return fig
 
     @staticmethod
+    @st.cache_data(**CACHE_OPTIONS)
     def sales_histogram(sales: pd.DataFrame) -> None:
         """
         Generates a histogram of sales data.
@@ -454,8 +698,16 @@ class Plots:
             sales (pd.DataFrame): DataFrame containing sales data.
         """
 
+        sales = Plots._downcast(sales)
+        # The histogram sums y per bin, so pre-aggregating per day leaves the
+        # bins unchanged while sending one point per day instead of per sale
+        daily = (
+            sales.groupby("Day", observed=True, sort=False)
+            .agg({"Gross Weight": "sum"})
+            .reset_index()
+        )
         fig = px.histogram(
-            sales,
+            daily,
             x="Day",
             y="Gross Weight",
             nbins=50,
@@ -464,24 +716,17 @@ class Plots:
         )
 
         # Add a rolling average line
-        weekly = sales.copy()
+        weekly = Plots._weekly_gross_weight(sales)
 
-        weekly = (
-            weekly.resample("W", on="Date").agg({"Gross Weight": "sum"}).reset_index()
-        )
-        weekly["RollingAvg"] = (
-            weekly["Gross Weight"].rolling(window=4, win_type="triang").mean().bfill()
-        )
-
-        # Ignore savgol_filter if it fails
+        # Ignore smoothing if it fails
         try:
             fig.add_trace(
                 go.Scatter(
                     x=weekly["Date"],
-                    y=savgol_filter(weekly["RollingAvg"], 10, 2),
+                    y=Plots._savgol(weekly["RollingAvg"].to_numpy(dtype=np.float64)),
                     mode="lines",
                     name="Weekly Average",
-                    line=dict(color=Color.DARK_RED.value, width=2),
+                    line=dict(color=DARK_RED, width=2),
                     hovertemplate=(
                         "Week: %{x}<br>" + "Average Gross Weight: %{y:.2f} g<br>"
                     ),
@@ -520,6 +765,7 @@ class Plots:
         return fig
 
     @staticmethod
+    @st.cache_data(**CACHE_OPTIONS)
     def item_weight_boxplot(
         sales: pd.DataFrame, purity=None, item_category=None
     ) -> None:
@@ -530,25 +776,19 @@ class Plots:
             sales (pd.DataFrame): DataFrame containing sales data.
         """
 
-        data = sales[(sales["Transaction Type"] == "SALE")]
-
-        if item_category:
-            data = data[data["Item Category"] == item_category]
-        if purity:
-            data = data[data["Purity Category"] == purity]
+        data = Plots._sales_only(sales)
+        data = Plots._downcast(
+            data.loc[Plots._selection_mask(data, item_category, purity)]
+        )
 
         # ----- Plotting ----- #
         fig = px.box(
-            data.loc[data.index.repeat(data["Unit Quantity"])]
-            .reset_index(drop=True)
-            .groupby(["Item Category", "Month", "Week"])
-            .agg({"Item Weight": "median"})
-            .reset_index(),
+            Plots._weekly_median_item_weight(data),
             x="Month",
             y="Item Weight",
             title=f"Median Weekly Item Weight by Month: {item_category if item_category else 'All Items'}",
             labels={"Item Category": "Item Category", "Item Weight": "Item Weight (g)"},
-            color_discrete_sequence=[Color.OCEAN_BLUE.value],
+            color_discrete_sequence=[OCEAN_BLUE],
             # points=False,
         )
 
@@ -557,17 +797,14 @@ class Plots:
             line_width=2,
         )
 
-        fig.update_layout(
-            xaxis_title="Item Category",
-            yaxis_title="Item Weight (g)",
-        )
-
         fig.update_layout(
             plot_bgcolor="rgba(0,0,0,0)",
             paper_bgcolor="rgba(0,0,0,0)",
             font=dict(color="black"),
             xaxis=dict(showgrid=False, zeroline=False, gridcolor="lightgray"),
             yaxis=dict(showgrid=True, zeroline=False, gridcolor="lightgray"),
+            xaxis_title="Item Category",
+            yaxis_title="Item Weight (g)",
             width=1000,
             height=600,
         )
@@ -586,11 +823,10 @@ class Plots:
             sales (pd.DataFrame): DataFrame containing sales data.
         """
 
-        data = sales[(sales["Transaction Type"] == "SALE")]
-        if item_category:
-            data = data[data["Item Category"] == item_category]
-        if purity:
-            data = data[data["Purity Category"] == purity]
+        data = Plots._sales_only(sales)
+        data = Plots._downcast(
+            data.loc[Plots._selection_mask(data, item_category, purity)]
+        )
         # ----- Plotting ----- #
         fig = px.histogram(
             data,
@@ -599,7 +835,7 @@ class Plots:
             histfunc="sum",
             nbins=nbins,
             title=f"Weight Distribution: {item_category if item_category else 'All Items'}",
-            color_discrete_sequence=[Color.OCEAN_BLUE.value],
+            color_discrete_sequence=[OCEAN_BLUE],
             barmode="relative",
         )
 
@@ -628,7 +864,9 @@ class Plots:
 
     @staticmethod
     def rolling_purity_performance(sales: pd.DataFrame, item="None"):
-        sales = sales if item == "None" else sales[sales["Item Category"] == item]
+        sales = Plots._downcast(
+            sales if item == "None" else sales[sales["Item Category"] == item]
+        )
 
         def add_line(fig, purity: str, color):
             """Adds a line for a given purity."""
@@ -644,9 +882,9 @@ class Plots:
 
         # Plot for all three as lines
         fig = go.Figure()
-        add_line(fig, "18K", Color.K18.value)
-        add_line(fig, "22K", Color.K22.value)
-        add_line(fig, "21K", Color.K21.value)
+        add_line(fig, "18K", K18)
+        add_line(fig, "22K", K22)
+        add_line(fig, "21K", K21)
 
         fig.update_traces(mode="lines", marker=dict(symbol="circle", size=8))
         fig.update_layout(
@@ -660,6 +898,7 @@ class Plots:
         return fig
 
     @staticmethod
+    @st.cache_data(**CACHE_OPTIONS)
     def item_mc_heatmap(sales: pd.DataFrame, purity, normalize=False) -> None:
         """
         Generates a heatmap of item making charges by item category and purity.
@@ -669,21 +908,25 @@ class Plots:
         """
 
         # ----- Isolate target data ----- #
-        df = (
-            sales.copy()
-            if purity == "None"
-            else sales[sales["Purity Category"] == purity].copy()
+        df = Plots._downcast(
+            sales if purity == "None" else sales[sales["Purity Category"] == purity]
         )
 
+        # Keep every weight range, but only the item categories present
+        df["Item Category"] = df["Item Category"].cat.remove_unused_categories()
         df = (
-            df.groupby(["Item Category", "Weight Range"])
+            df.groupby(["Item Category", "Weight Range"], observed=False, sort=False)
             .agg({"Making Value": "sum"})
             .reset_index()
         )
 
         # Min-Max Normalized Values for each Item Category
-        df["Value_norm"] = df.groupby("Item Category")["Making Value"].transform(
-            lambda x: (x - x.min()) / (x.max() - x.min())
+        df["Value_norm"] = df.groupby("Item Category", observed=True, sort=False)[
+            "Making Value"
+        ].transform(
+            # Guard the float32 range against a zero (or subnormal) denominator
+            lambda x: (x - x.min())
+            / max(x.max() - x.min(), np.finfo(np.float32).tiny)
         )
 
         # Calculate zmax
@@ -27,13 +27,9 @@ The following columns will be auto-generated
     Day (str): The day of the transaction.
 """
 
-from typing import List
-from enum import Enum
+from typing import List, Tuple
 import pandas as pd
-import subprocess
-import logging
-import os
-import io
+import numpy as np
 import re
 
 
@@ -45,19 +41,58 @@ class Purity:
         "9K": (0.375, 0.41),
     }
 
+    # The (non-overlapping) ranges as arrays sorted by lower bound, so that
+    # lookups are a binary search rather than a scan over the dict
+    _spreads = np.array(list(ranges.values()))
+    _order = np.argsort(_spreads[:, 0])
+    keys = np.array(list(ranges.keys()))[_order]
+    lows, highs = _spreads[_order, 0], _spreads[_order, 1]
+
+    @staticmethod
+    def get_purity_index(purity: np.ndarray) -> np.ndarray:
+        """
+        Finds the index into `Purity.keys` of the range containing each purity.
+
+        Args:
+            purity (np.ndarray): The purities to look up.
+
+        Returns:
+            np.ndarray: The int8 range index of each purity.
+        """
+        values = np.asarray(purity, dtype=np.float64)
+        idx = np.searchsorted(Purity.lows, values, side="right") - 1
+        valid = (idx >= 0) & (values <= Purity.highs[idx.clip(0)])
+        if not valid.all():
+            raise ValueError(f"No compatible purity found for {values[~valid][0]}.")
+        return idx.astype(np.int8)
+
     @staticmethod
     def get_purity_category(purity: float):
-        for key, spread in Purity.ranges.items():
-            if purity >= spread[0] and purity <= spread[1]:
-                return key
-        raise ValueError(f"No compatible purity found for {purity}.")
+        return str(Purity.keys[Purity.get_purity_index([purity])[0]])
 
     @staticmethod
     def get_manufacturing_purity(purity: float):
-        for key, spread in Purity.ranges.items():
-            if purity >= spread[0] and purity <= spread[1]:
-                return spread[0]
-        raise ValueError(f"No compatible purity found for {purity}.")
+        return float(Purity.lows[Purity.get_purity_index([purity])[0]])
+
+    @staticmethod
+    def categorize(purity: pd.Series) -> Tuple[pd.Categorical, np.ndarray]:
+        """
+        Vectorized equivalent of `get_purity_category` and
+        `get_manufacturing_purity` over a whole column.
+
+        Args:
+            purity (pd.Series): The purities to categorize.
+
+        Returns:
+            Tuple[pd.Categorical, np.ndarray]: The purity categories (as int8
+            codes, without materializing strings) and the corresponding
+            manufacturing purities.
+        """
+        codes = Purity.get_purity_index(purity.to_numpy(dtype=np.float64))
+        return (
+            pd.Categorical.from_codes(codes, categories=Purity.keys),
+            Purity.lows[codes],
+        )
 
 
 class Sales:
@@ -78,11 +113,42 @@ class Sales:
         "Making Value",
     ]
 
+    # Item category prefix of an item code, after its (up to 2 digit) purity
+    item_code_pattern = re.compile(r"\d{0,2}(\w+)")
+
+    item_categories = {
+        "BRA": "Bracelets",
+        "CHA": "Chains",
+        "C": "Chains",
+        "CHAHA": "Chains",
+        "BAN": "Bangles",
+        "RIN": "Rings",
+        "RING": "Rings",
+        "PEN": "Pendants",
+        "PSET": "Pendants",
+        "UNCAT": "Uncategorized",
+        "UNK": "Uncategorized",
+    }
+
+    categorical_columns = [
+        "Purity Category",
+        "Item Category",
+        "Transaction Type",
+        "Month",
+        "Week",
+        "Day",
+    ]
+
     def __init__(self, df: pd.DataFrame = None):
-        self._df: pd.DataFrame = df
+        # Added frames are buffered and concatenated once, on first access
+        self._frames: List[pd.DataFrame] = [] if df is None else [df]
+        self._df: pd.DataFrame = None
 
     @property
     def data(self):
+        if self._df is None and self._frames:
+            self._df = pd.concat(self._frames, ignore_index=True)
+            self.__categorize()
         return self._df
 
     @property
@@ -94,7 +160,7 @@ class Sales:
 
     def add_data(self, df: pd.DataFrame, mapping: dict = None):
         """
-        Adds data to the `_df` attribute.
+        Adds data to the sales data.
 
         Args:
             df (pd.DataFrame): The dataframe to add.
@@ -106,57 +172,101 @@ class Sales:
                     "Not all required keys in mapping are present in the dataframe."
                 )
             df = df.rename(columns=mapping)
-        df = self.__preprocess(df)
-        if self._df is None:
-            self._df = df
-        else:
-            self._df = pd.concat([self._df, df], ignore_index=True)
+        self._frames.append(self.__preprocess(df))
+        self._df = None
+
+    @staticmethod
+    def _period_labels(periods: np.ndarray, label) -> pd.Categorical:
+        """
+        Labels periods as a categorical, formatting each distinct period once.
+
+        Args:
+            periods (np.ndarray): The datetime64 periods.
+            label (Callable): Formats an array of periods as strings.
+
+        Returns:
+            pd.Categorical: The labels, with categories in chronological order.
+        """
+        valid = ~np.isnat(periods)
+        uniques, inverse = np.unique(periods[valid], return_inverse=True)
+        codes = np.full(len(periods), -1, dtype=np.int32)
+        codes[valid] = inverse
+        return pd.Categorical.from_codes(codes, categories=label(uniques))
+
+    def __categorize(self):
+        """
+        Casts the low-cardinality label columns to `category` dtype.
+
+        This is done after concatenation, as concatenating categoricals with
+        differing categories falls back to object dtype.
+        """
+        for col in Sales.categorical_columns:
+            if col in self._df.columns:
+                self._df[col] = self._df[col].astype("category")
 
     def __preprocess(self, df):
-        # Date Attributes
-        df["Month"] = df["Date"].dt.to_period("M").astype(str)
-        df["Week"] = df["Date"].dt.to_period("W").astype(str)
-        df["Day"] = df["Date"].dt.to_period("D").astype(str)
-
-        # Codes and Categories
-        df["Item Code"] = df["Item Code"].str.upper()
-        df["Item Category"] = df["Item Code"].str.extract(r"\d{0,2}(\w+)")
-        df["Item Category"] = df["Item Category"].map(
-            {
-                "BRA": "Bracelets",
-                "CHA": "Chains",
-                "C": "Chains",
-                "CHAHA": "Chains",
-                "BAN": "Bangles",
-                "RIN": "Rings",
-                "RING": "Rings",
-                "PEN": "Pendants",
-                "PSET": "Pendants",
-                "UNCAT": "Uncategorized",
-                "UNK": "Uncategorized",
-            }
+        # Date Attributes, formatted as their periods would be (weeks run
+        # Monday to Sunday) but once per distinct period
+        days = df["Date"].to_numpy().astype("datetime64[D]")
+        # 1970-01-01 was a Thursday, 3 days after the start of its week
+        mondays = days - (days.astype(np.int64) + 3) % 7
+        df["Month"] = Sales._period_labels(
+            days.astype("datetime64[M]"), np.datetime_as_string
+        )
+        df["Week"] = Sales._period_labels(
+            mondays,
+            lambda start: np.char.add(
+                np.char.add(np.datetime_as_string(start), "/"),
+                np.datetime_as_string(start + 6),
+            ),
         )
+        df["Day"] = Sales._period_labels(days, np.datetime_as_string)
 
-        # Remove Uncategorized items if none exist
-        if df[df["Item Category"] == "Uncategorized"].empty:
-            df = df[df["Item Category"] != "Uncategorized"].copy()
+        # Codes and Categories. Each distinct code is uppercased and mapped
+        # once and the results broadcast through the factorized codes, storing
+        # the category as a categorical
+        codes, uniques = pd.factorize(df["Item Code"])
+        uniques = pd.Index(uniques).str.upper()
+        df["Item Code"] = uniques.array.take(codes, allow_fill=True)
+        prefixes = uniques.str.extract(Sales.item_code_pattern, expand=False)
+        # Categories are sorted, so that plots grouped on them list the items
+        # alphabetically whatever the order of the data (or of the sources)
+        labels, categories = pd.factorize(
+            prefixes.map(Sales.item_categories), sort=True
+        )
+        # Missing codes (-1) index the trailing -1, which also holds when no
+        # code is present at all
+        df["Item Category"] = pd.Categorical.from_codes(
+            np.append(labels, -1)[codes], categories=categories
+        )
 
         # Edge case: Drop 0.995
-        df = df[df["Purity"] != 0.995].copy()
+        mask = df["Purity"].to_numpy() != 0.995
+        # Remove Uncategorized items if none exist
+        uncategorized = (df["Item Category"] == "Uncategorized").to_numpy()
+        if not uncategorized.any():
+            mask &= ~uncategorized
+        df = df.loc[mask].copy()
 
         # Purity
-        df["Purity Category"] = df["Purity"].apply(Purity.get_purity_category)
-        df["Manufacturing Purity"] = df["Purity"].apply(Purity.get_manufacturing_purity)
+        df["Purity Category"], manufacturing_purity = Purity.categorize(df["Purity"])
+        df["Manufacturing Purity"] = manufacturing_purity
 
-        # Calculate gold earnings
-        df["Gold Gains"] = (df["Purity"] - df["Manufacturing Purity"]) * df[
-            "Gross Weight"
-        ]
+        # Calculate gold earnings, reusing one buffer for the intermediates
+        gross = df["Gross Weight"].to_numpy(dtype=np.float64)
+        gains = np.subtract(
+            df["Purity"].to_numpy(dtype=np.float64), manufacturing_purity
+        )
+        df["Gold Gains"] = np.multiply(gains, gross, out=gains)
 
-        df["Item Weight"] = df["Gross Weight"] / df["Unit Quantity"]
+        # Items without a unit quantity get a NaN (rather than inf) weight
+        quantity = df["Unit Quantity"].to_numpy(dtype=np.float64)
+        df["Item Weight"] = np.divide(
+            gross, quantity, out=np.full_like(gross, np.nan), where=quantity != 0
+        )
 
-        # Weight Ranges
-        bins = [0, 20, 30, 40, 50, 100, 150, float("inf")]
+        # Weight Ranges: [0, 20), [20, 30), ..., [150, inf)
+        bins = np.array([0, 20, 30, 40, 50, 100, 150])
         labels = [
             "<20g",
             "20-30g",
@@ -166,8 +276,12 @@ class Sales:
             "100-150g",
             ">150g",
         ]
-        df["Weight Range"] = pd.cut(
-            df["Item Weight"], bins=bins, labels=labels, right=False
+        weights = df["Item Weight"].to_numpy(dtype=np.float64)
+        codes = np.searchsorted(bins, weights, side="right") - 1
+        # Negative, infinite and missing weights fall outside every range
+        codes[~np.isfinite(weights)] = -1
+        df["Weight Range"] = pd.Categorical.from_codes(
+            codes.astype(np.int8), categories=labels, ordered=True
         )
 
         return df
@@ -0,0 +1,125 @@
+"""
+Parquet cache of the frames processed by the readers, and the workbook engine
+they share.
+
+The cached frames hold the decrypted contents of password-protected
+workbooks, so caching is opt-in: it is only used when `ParquetCacheDir` is set
+(e.g. in `.env`) and pyarrow is installed. Each reader keeps a single entry,
+and writing a new one deletes the reader's entries for earlier inputs once it
+is in place.
+"""
+
+from dotenv import load_dotenv
+from typing import List
+import pandas as pd
+import importlib.util
+import tempfile
+import hashlib
+import glob
+import os
+
+load_dotenv()
+
+# Parse workbooks with the Rust-backed calamine engine (pandas >= 2.2) when it
+# is installed, falling back to pandas' default (openpyxl) otherwise
+EXCEL_ENGINE = "calamine" if importlib.util.find_spec("python_calamine") else None
+
+CACHE_DIR = (
+    os.getenv("ParquetCacheDir") if importlib.util.find_spec("pyarrow") else None
+)
+
+if CACHE_DIR:
+    import pyarrow
+
+
+def cache_paths(
+    reader: str, version: int, tables: List[str], files: List[str], *keys
+) -> List[str]:
+    """
+    Returns the cache paths of a reader's tables, keyed by the version of its
+    processing, its input files and any further keys.
+
+    Args:
+        reader (str): Name of the reader, prefixing its cache entries.
+        version (int): Version of the reader's processing, bumped whenever it
+            changes the cached tables so that older entries are not reused.
+        tables (List[str]): Names of the cached tables.
+        files (List[str]): Paths to every input file the tables are built from.
+        *keys: Further values the tables depend on.
+
+    Returns:
+        List[str]: The cache paths, or None if caching is disabled.
+    """
+    if not CACHE_DIR:
+        return None
+
+    # The upload page rewrites the files on each upload, so they are keyed by
+    # their contents rather than their modification times
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{version}\0".encode())
+    for filepath in files:
+        with open(filepath, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+        digest.update(b"\0")
+    for key in keys:
+        digest.update(f"{key}\0".encode())
+
+    key = digest.hexdigest()
+    return [
+        os.path.join(CACHE_DIR, f"{reader}-{key}-{table}.parquet") for table in tables
+    ]
+
+
+def read_cache(paths: List[str]) -> List[pd.DataFrame]:
+    """
+    Reads cached tables.
+
+    Args:
+        paths (List[str]): The cache paths, as returned by `cache_paths`.
+
+    Returns:
+        List[pd.DataFrame]: The tables, or None if any of them is not cached
+        or cannot be read.
+    """
+    if not paths:
+        return None
+    try:
+        return [pd.read_parquet(path) for path in paths]
+    except (OSError, pyarrow.ArrowException):
+        # Missing, pruned by another session or unreadable: a cache miss
+        return None
+
+
+def write_cache(reader: str, paths: List[str], tables: List[pd.DataFrame]) -> None:
+    """
+    Caches a reader's tables, deleting its entries for earlier inputs.
+
+    Args:
+        reader (str): Name of the reader, prefixing its cache entries.
+        paths (List[str]): The cache paths, as returned by `cache_paths`.
+        tables (List[pd.DataFrame]): The tables to cache.
+    """
+    if not paths:
+        return
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Each table is written to a temporary file and renamed into place, so
+    # that concurrent sessions never read a partially written entry
+    for table, path in zip(tables, paths):
+        fd, temp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        os.close(fd)
+        try:
+            table.to_parquet(temp, compression="zstd")
+            os.replace(temp, path)
+        except BaseException:
+            os.remove(temp)
+            raise
+
+    for path in glob.glob(os.path.join(glob.escape(CACHE_DIR), f"{reader}-*.parquet")):
+        if path not in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Already pruned by another session
+                pass
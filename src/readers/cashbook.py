@@ -1,15 +1,45 @@
 from dotenv import load_dotenv
 from typing import List
 import pandas as pd
+import numpy as np
 import msoffcrypto
 import json
 import os
 import io
+import importlib.util
+import functools
+
+from src.readers.cache import EXCEL_ENGINE, cache_paths, read_cache, write_cache
 
 load_dotenv()
 
+# pyarrow enables arrow-backed strings, which run the text cleanup in
+# vectorized arrow compute kernels rather than per-element Python calls
+PARQUET = importlib.util.find_spec("pyarrow") is not None
+STRING_DTYPE = "string[pyarrow]" if PARQUET else "string"
+
+
+@functools.lru_cache(maxsize=None)
+def _load_json(filepath: str, mtime: float):
+    # `mtime` is only part of the cache key, so that edited files are re-read
+    with open(filepath, "r") as file:
+        return json.load(file)
+
 
 class CashbookReader:
+    # Version of the processing behind the cached books. Bump it whenever a
+    # change alters the books, so that cached ones are re-read
+    cache_version = 1
+
+    # Supplier account sheet names and the cashbook category they replace
+    supplier_accounts = {
+        "NEVERTITI SHJ": "NEVERTITI SHJ",
+        "NEVERTITI (DUBAI)": "NEVERTITI DUBAI",
+        "MUBARAK TOOLS": "MUBARAK",
+        "HARSHAD PRIME": "HARSHAD PRIME",
+        "HARSHAD": "HARSHAD",
+    }
+
     def __init__(
         self,
         filepath: str,
@@ -22,67 +52,36 @@ class CashbookReader:
         self.__expense_categories = self.__read_categories_file(expense_categories)
         self.__income_categories = self.__read_categories_file(income_categories)
         self.__fixed_costs = self.__read_categories_file(fixed_costs)
-
-        # Read sheets
-        self._workbook = self.__read_workbook(filepath)
-        self._mcb, self._qtr, self._cashbook = self.__read_sheets(self._workbook)
-
-        # Read supplier accounts
-        kwargs = {
-            "workbook": self._workbook,
-            "cols": [
-                "Date",
-                "Invoice No.",
-                "Description",
-                "VAT Amount",
-                "Total",
-            ],
-        }
-        self.read_supplier_account(sheet_name="NEVERTITI SHJ", **kwargs)
-        self.read_supplier_account(
-            sheet_name="NEVERTITI (DUBAI)", category_name="NEVERTITI DUBAI", **kwargs
+        self.__expense_maps = self.__flatten_categories(self.__expense_categories)
+        self.__income_maps = self.__flatten_categories(self.__income_categories)
+        self.__labels = self.__index_labels()
+
+        self._filepath = filepath
+        self._workbook = None
+
+        # Reuse the processed books of a previous read of the same inputs. The
+        # year filter depends on the current year, and the parsed values on
+        # the Excel engine
+        cache = cache_paths(
+            "cashbook",
+            CashbookReader.cache_version,
+            ["cashbook", "mcb", "qtr"],
+            [filepath, expense_categories, income_categories, fixed_costs],
+            only_this_year,
+            pd.Timestamp.now().year,
+            EXCEL_ENGINE,
         )
-
-        self.read_supplier_account(
-            sheet_name="MUBARAK TOOLS", category_name="MUBARAK", **kwargs
-        )
-
-        self.read_supplier_account(sheet_name="HARSHAD PRIME", **kwargs)
-        self.read_supplier_account(sheet_name="HARSHAD", **kwargs)
-
-        # Restrict to this year
-        if only_this_year:
-            current_year = pd.Timestamp.now().year
-            self._cashbook = self._cashbook[
-                self._cashbook["Date"].dt.year == current_year
-            ]
-            self._mcb = self._mcb[self._mcb["Date"].dt.year == current_year]
-            self._qtr = self._qtr[self._qtr["Date"].dt.year == current_year]
-
-        # Apply categories
-        self.__assign_categories(self._cashbook)
-        self.__assign_categories(self._mcb)
-        self.__assign_categories(self._qtr)
+        cached = read_cache(cache)
+        if cached:
+            self._cashbook, self._mcb, self._qtr = cached
+        else:
+            self._cashbook, self._mcb, self._qtr = self.__read_books(
+                filepath, only_this_year
+            )
+            write_cache("cashbook", cache, [self._cashbook, self._mcb, self._qtr])
 
         self._fixed_costs = self.__read_fixed_costs(self.__fixed_costs)
 
-        # Re-organize columns
-        col_structure = [
-            "Date",
-            "Details",
-            "Debit",
-            "Credit",
-            "Balance",
-            "Category",
-            "Super-Category",
-            "Sub-Category",
-            "Cost Type",
-            "QTR",
-        ]
-        self._cashbook = self._cashbook[col_structure]
-        self._mcb = self._mcb[col_structure]
-        self._qtr = self._qtr[col_structure]
-
     @property
     def workbook(self):
         """
@@ -91,6 +90,9 @@ class CashbookReader:
         Returns:
             io.BytesIO: The decrypted workbook object.
         """
+        # Decrypted on first access, rather than kept from reading the books
+        if self._workbook is None:
+            self._workbook = self.__read_workbook(self._filepath)
         return self._workbook
 
     @property
@@ -133,12 +135,101 @@ class CashbookReader:
         """
         return self._qtr
 
-    def __read_sheets(self, workbook) -> pd.DataFrame:
+    def __read_books(self, filepath: str, only_this_year: bool):
+        """
+        Reads, merges and categorizes the cash books of the workbook.
+
+        Args:
+            filepath (str): Path to the encrypted Excel file.
+            only_this_year (bool): Whether to keep this year's records only.
+
+        Returns:
+            tuple: The combined cashbook, main cash book and QTR cash book.
+        """
+        # Bounds of this year, compared against rather than extracting years
+        current_year = pd.Timestamp.now().year
+        start = np.datetime64(f"{current_year}-01-01")
+        end = np.datetime64(f"{current_year + 1}-01-01")
+
+        # Read sheets. The decrypted workbook is opened (and its archive and
+        # shared strings parsed) once, and every sheet is read from that handle.
+        # The decrypted copy is not kept once the books are read; `workbook`
+        # decrypts again on demand
+        with pd.ExcelFile(
+            self.__read_workbook(filepath), engine=EXCEL_ENGINE
+        ) as workbook:
+            cashbook = self.__read_sheets(
+                workbook, since=start if only_this_year else None
+            )
+
+            # Read supplier accounts
+            cols = ["Date", "Invoice No.", "Description", "VAT Amount", "Total"]
+            supplier_accounts = [
+                self.read_supplier_account(
+                    workbook=workbook,
+                    sheet_name=sheet_name,
+                    cols=cols,
+                    category_name=category_name,
+                )
+                for sheet_name, category_name in CashbookReader.supplier_accounts.items()
+            ]
+
+        suppliers = pd.concat(supplier_accounts, ignore_index=True)
+
+        # Restrict to this year
+        if only_this_year:
+            cashbook = self.__between(cashbook, start, end)
+            suppliers = self.__between(suppliers, start, end)
+
+        # Apply categories, once for the main and QTR cash books together
+        self.__assign_categories(cashbook)
+        self.__assign_categories(suppliers)
+        qtr_rows = cashbook["QTR"].to_numpy()
+        mcb, qtr = cashbook[~qtr_rows], cashbook[qtr_rows]
+
+        # Replace the cashbook records of each supplier with its account, in a
+        # single concat
+        cashbook = pd.concat(
+            [
+                cashbook[
+                    ~cashbook["Category"].isin(
+                        CashbookReader.supplier_accounts.values()
+                    )
+                ],
+                suppliers,
+            ],
+            ignore_index=True,
+        )
+        # Concatenating with the supplier accounts falls back to object dtype
+        cashbook["Category"] = cashbook["Category"].astype("category")
+
+        # Re-organize columns
+        col_structure = [
+            "Date",
+            "Details",
+            "Debit",
+            "Credit",
+            "Balance",
+            "Category",
+            "Super-Category",
+            "Sub-Category",
+            "Cost Type",
+            "QTR",
+        ]
+        cashbook = cashbook[col_structure]
+        mcb = mcb[col_structure]
+        qtr = qtr[col_structure]
+
+        return cashbook, mcb, qtr
+
+    def __read_sheets(self, workbook, since: np.datetime64 = None) -> pd.DataFrame:
         """
         Reads the sheets from the workbook and returns a dictionary of DataFrames.
 
         Args:
             workbook: The decrypted workbook object.
+            since (np.datetime64, optional): Drop records before this date.
+                Defaults to None.
 
         Returns:
             pd.DataFrame: A DataFrame containing the combined cashbook data.
@@ -147,27 +238,62 @@ class CashbookReader:
             workbook,
             "MAIN CASH BOOK",
             ["Date", "Details", "Category", "Debit", "Credit", "Balance"],
+            opening_balance=True,
+            since=since,
         )
-        # Set first row Credit as Balance amount
-        mcb.loc[0, "Credit"] = mcb.loc[0, "Balance"]
-        mcb["Balance"] = mcb.Credit.cumsum() - mcb.Debit.cumsum()
         mcb["QTR"] = False
 
         qtr = self.__read_sheet(
             workbook,
             "QTR CASH",
             ["Date", "Details", "Category", "Credit", "Debit", "Balance"],
+            since=since,
         )
-        qtr["Balance"] = qtr.Credit.cumsum() - qtr.Debit.cumsum()
         qtr["QTR"] = True
 
         cashbook = pd.concat([mcb, qtr], ignore_index=True)
-        cashbook.sort_index(inplace=True)
-        return mcb, qtr, cashbook
+        # The books' categories differ, so the concat falls back to object dtype
+        cashbook["Category"] = cashbook["Category"].astype("category")
+        return cashbook
+
+    @staticmethod
+    def __between(
+        book: pd.DataFrame, start: np.datetime64, end: np.datetime64
+    ) -> pd.DataFrame:
+        """
+        Selects the records of a book dated within [start, end).
+
+        Args:
+            book (pd.DataFrame): The book to filter.
+            start (np.datetime64): The first date to keep.
+            end (np.datetime64): The first date to drop.
+
+        Returns:
+            pd.DataFrame: The records within the range, taken by position.
+        """
+        dates = book["Date"].to_numpy()
+        return book.iloc[np.flatnonzero((dates >= start) & (dates < end))]
+
+    @staticmethod
+    def __running_balance(book: pd.DataFrame) -> np.ndarray:
+        """
+        Computes the running balance of a cash book in a single cumulative
+        pass over the net amounts.
+
+        Args:
+            book (pd.DataFrame): The cash book, with Credit and Debit columns.
+
+        Returns:
+            np.ndarray: The balance after each record.
+        """
+        credit = book["Credit"].to_numpy(dtype=np.float64)
+        net = credit - book["Debit"].to_numpy(dtype=np.float64)
+        return np.cumsum(net, out=net)
 
     def __read_categories_file(self, filepath):
         """
-        Reads a JSON file containing categories.
+        Reads a JSON file containing categories. Parsed files are shared
+        between instances until the file is modified.
 
         Args:
             filepath (str): Path to the JSON file.
@@ -175,8 +301,7 @@ class CashbookReader:
         Returns:
             dict: Dictionary containing the categories.
         """
-        with open(filepath, "r") as file:
-            return json.load(file)
+        return _load_json(filepath, os.path.getmtime(filepath))
 
     def __read_workbook(self, filepath: str) -> io.BytesIO:
         """
@@ -195,7 +320,14 @@ class CashbookReader:
             office_file.decrypt(decrypted_workbook)
         return decrypted_workbook
 
-    def __read_sheet(self, workbook, sheet_name: str, cols: List[str]) -> pd.DataFrame:
+    def __read_sheet(
+        self,
+        workbook,
+        sheet_name: str,
+        cols: List[str],
+        opening_balance: bool = False,
+        since: np.datetime64 = None,
+    ) -> pd.DataFrame:
         """
         Reads a specific sheet from the workbook and returns a DataFrame.
 
@@ -203,6 +335,10 @@ class CashbookReader:
             workbook: The decrypted workbook object.
             sheet_name (str): The name of the sheet to read.
             cols (List[str]): List of column names to read.
+            opening_balance (bool): Whether the first row's Balance is the
+                opening balance. Defaults to False.
+            since (np.datetime64, optional): Drop records before this date.
+                Defaults to None.
 
         Returns:
             pd.DataFrame: A DataFrame containing the data from the specified sheet.
@@ -215,8 +351,8 @@ class CashbookReader:
             usecols="C:H",
             dtype={
                 "Date": "datetime64[ns]",
-                "Details": "string",
-                "Category": "string",
+                "Details": STRING_DTYPE,
+                "Category": STRING_DTYPE,
                 "Debit": "float64",
                 "Credit": "float64",
                 "Balance": "float64",
@@ -225,9 +361,21 @@ class CashbookReader:
 
         df["Debit"] = df["Debit"].fillna(0)
         df["Credit"] = df["Credit"].fillna(0)
-        df["Category"] = df["Category"].str.strip().str.upper()
+        df = df[pd.notna(df["Date"])]
+
+        if opening_balance:
+            # Set first row Credit as Balance amount
+            df.loc[0, "Credit"] = df.loc[0, "Balance"]
+        df["Balance"] = self.__running_balance(df)
+
+        # Older records are dropped only once they are part of the balance,
+        # so that the string cleanup below runs on the kept rows alone
+        if since is not None:
+            df = df[df["Date"].to_numpy() >= since]
 
-        return df[pd.notna(df["Date"])]
+        df["Category"] = df["Category"].str.strip().str.upper().astype("category")
+
+        return df
 
     def read_supplier_account(
         self, workbook, sheet_name: str, cols: List[str], category_name: str = None
@@ -244,7 +392,6 @@ class CashbookReader:
         Returns:
             pd.DataFrame: A DataFrame containing the supplier account data.
         """
-        # Replace in cashbook
         if category_name is None:
             category_name = sheet_name
 
@@ -262,30 +409,23 @@ class CashbookReader:
             },
         )
 
-        df["Total"] = df["Total"].fillna(0)
-        # Keep records from this year only
-        df = df[df.Date >= pd.Timestamp("2025-01-01")]
-        # Keep only Debit records
-        df = df[df["Total"] > 0]
-
-        # Transform to match structure of cashbook
-        df.rename(columns={"Total": "Debit", "Description": "Details"}, inplace=True)
-        df["Credit"] = 0.0
-        df["Super-Category"] = "Operations"
-        df["Sub-Category"] = "Suppliers"
-        df["Category"] = category_name
-        df["Cost Type"] = "VARIABLE"
-        df["QTR"] = False
-
-        df.drop(columns=["VAT Amount", "Invoice No."], inplace=True)
-
-        # Remove all records with this category from cashbook
-        self._cashbook = self._cashbook[self._cashbook["Category"] != category_name]
-
-        # Add to cashbook
-        self._cashbook = pd.concat(
-            [self._cashbook, df],
-            ignore_index=True,
+        # Keep Debit records from this year only (missing totals are not > 0)
+        df = df.loc[
+            (df["Date"] >= pd.Timestamp("2025-01-01")) & (df["Total"] > 0),
+            ["Date", "Description", "Total"],
+        ]
+
+        # Transform to match structure of cashbook, adding the constant
+        # columns in one step
+        return df.rename(columns={"Total": "Debit", "Description": "Details"}).assign(
+            **{
+                "Credit": 0.0,
+                "Super-Category": "Operations",
+                "Sub-Category": "Suppliers",
+                "Category": category_name,
+                "Cost Type": "VARIABLE",
+                "QTR": False,
+            }
         )
 
     def __assign_categories(self, book) -> None:
@@ -295,102 +435,105 @@ class CashbookReader:
         Args:
             book (pd.DataFrame): The cashbook DataFrame to which categories will be assigned.
         """
-        book["Sub-Category"] = book.apply(
-            lambda row: self.__assign_subcategory(
-                row,
-                (
-                    self.__income_categories
-                    if row["Credit"] > 0
-                    else self.__expense_categories
-                ),
-            ),
-            axis=1,
+        income_sub = self.__income_maps[0]
+        expense_sub = self.__expense_maps[0]
+        (
+            subcategories,
+            supercategories,
+            cost_types,
+            income_super,
+            expense_super,
+            expense_cost,
+        ) = self.__labels
+        # Credit rows are looked up in the income categories
+        income = book["Credit"].to_numpy() > 0
+
+        # Each distinct label is looked up once, and the rows gather their
+        # result by integer code. Missing categories (code -1) index the
+        # trailing None.
+        category = book["Category"].astype("category")
+        categories = [*category.cat.categories, None]
+        codes = category.cat.codes.to_numpy()
+
+        sub = np.where(
+            income,
+            self.__lookup(income_sub, categories, subcategories)[codes],
+            self.__lookup(expense_sub, categories, subcategories)[codes],
         )
-
-        book["Super-Category"] = book.apply(
-            lambda row: self.__assign_supercategory(
-                row,
-                (
-                    self.__income_categories
-                    if row["Credit"] > 0
-                    else self.__expense_categories
-                ),
-            ),
-            axis=1,
-        )
-
+        sup = np.where(income, income_super[sub], expense_super[sub])
         # Apply cost type only on rows where Debit > 0
-        book["Cost Type"] = book.apply(
-            lambda row: (
-                self.__assign_cost_type(row, (self.__expense_categories))
-                if row["Debit"] > 0
-                else ""
-            ),
-            axis=1,
+        cost = np.where(book["Debit"].to_numpy() > 0, expense_cost[sub], 0)
+
+        book["Sub-Category"] = pd.Categorical.from_codes(sub, categories=subcategories)
+        book["Super-Category"] = pd.Categorical.from_codes(
+            sup, categories=supercategories
         )
+        book["Cost Type"] = pd.Categorical.from_codes(cost, categories=cost_types)
 
-    def __read_categories_file(self, filepath):
+    def __index_labels(self) -> tuple:
         """
-        Reads a JSON file containing categories.
-
-        Args:
-            filepath (str): Path to the JSON file.
+        Resolves the sub-category level lookups, which do not depend on the
+        book, to label code arrays indexed by sub-category code.
 
         Returns:
-            dict: Dictionary containing the categories.
-        """
-        with open(filepath, "r") as file:
-            return json.load(file)
+            tuple: The sub-category, super-category and cost type labels, and
+            the income super-category, expense super-category and cost type
+            code of each sub-category.
+        """
+        _, income_super, _ = self.__income_maps
+        _, expense_super, expense_cost = self.__expense_maps
+
+        subcategories = pd.Index(["Uncategorized", *income_super, *expense_super])
+        subcategories = subcategories.unique()
+        supercategories = pd.Index(
+            ["Uncategorized", *income_super.values(), *expense_super.values()]
+        ).unique()
+        cost_types = pd.Index(["", "Uncategorized", *expense_cost.values()]).unique()
+
+        return (
+            subcategories,
+            supercategories,
+            cost_types,
+            self.__lookup(income_super, subcategories, supercategories),
+            self.__lookup(expense_super, subcategories, supercategories),
+            self.__lookup(expense_cost, subcategories, cost_types),
+        )
 
-    def __assign_subcategory(self, row, category_db):
+    @staticmethod
+    def __lookup(mapping: dict, keys: list, labels: pd.Index) -> np.ndarray:
         """
-        Assigns a subcategory to a row based on the category database.
+        Maps each key and returns the position of the result in `labels`.
 
         Args:
-            row (pd.Series): A row from the DataFrame.
-            category_db (dict): Dictionary containing categories and subcategories.
+            mapping (dict): The lookup map.
+            keys (list): The keys to map.
+            labels (pd.Index): The possible results, including "Uncategorized".
 
         Returns:
-            str: The subcategory if found, otherwise "Uncategorized".
+            np.ndarray: The label code of each key, "Uncategorized" if unmapped.
         """
-        for _, subcategories in category_db.items():
-            for key, vals in subcategories.items():
-                if row["Category"] in vals["values"]:
-                    return key
-        return "Uncategorized"
+        return labels.get_indexer([mapping.get(key, "Uncategorized") for key in keys])
 
-    def __assign_supercategory(self, row, category_db):
+    def __flatten_categories(self, category_db):
         """
-        Assigns a supercategory to a row based on the category database.
+        Flattens a category database into lookup maps. As with the row-wise
+        lookups, the first match in the database wins.
 
         Args:
-            row (pd.Series): A row from the DataFrame.
             category_db (dict): Dictionary containing categories and subcategories.
 
         Returns:
-            str: The supercategory if found, otherwise "Uncategorized".
+            tuple: Maps of category to subcategory, subcategory to supercategory,
+            and subcategory to cost type.
         """
+        sub_map, super_map, cost_map = {}, {}, {}
         for category, subcategories in category_db.items():
-            if row["Sub-Category"] in subcategories.keys():
-                return category
-        return "Uncategorized"
-
-    def __assign_cost_type(self, row, category_db):
-        """
-        Assigns a cost type to a row based on the category database.
-
-        Args:
-            row (pd.Series): A row from the DataFrame.
-            category_db (dict): Dictionary containing categories and subcategories.
-
-        Returns:
-            str: The cost type if found, otherwise "Uncategorized".
-        """
-        for _, subcategories in category_db.items():
             for key, vals in subcategories.items():
-                if key == row["Sub-Category"]:
-                    return vals["key"]
-        return "Uncategorized"
+                super_map.setdefault(key, category)
+                cost_map.setdefault(key, vals.get("key", "Uncategorized"))
+                for value in vals["values"]:
+                    sub_map.setdefault(value, key)
+        return sub_map, super_map, cost_map
 
     def __read_fixed_costs(self, fixed_costs: str) -> pd.DataFrame:
         """
@@ -1,22 +1,60 @@
 from dotenv import load_dotenv
 from typing import List
 import pandas as pd
+import numpy as np
 import msoffcrypto
 import json
 import os
 import io
+import re
+
+from src.readers.cache import EXCEL_ENGINE, cache_paths, read_cache, write_cache
 
 load_dotenv()
 
 
 class QTRReader:
+    customer_names = {
+        "VIVAA": "Vivaa Jewellery Trading LLC",
+        "VIVAA S": "Vivaa Jewellery Trading LLC",
+        "NIMISHA": "Nimisha Jewellers LLC",
+    }
+
+    # Item code formatting: substitutions applied in order, then whole-code
+    # renames
+    item_code_substitutions = [
+        (re.compile(r"(\d{2}) (\w+)"), r"\1\2"),
+        (re.compile(r"CCH\w?"), "CHA"),
+        (re.compile(r"CB\w+"), "BRA"),
+        (re.compile(r"BGL"), "BAN"),
+        (re.compile(r"HP\w"), ""),
+        (re.compile(r"(\d{2})C"), r"\1CHA"),
+    ]
+    item_code_renames = {"PSET": "PEN", "SCRAP": "UNK", "PURE": "UNK", "": "UNK"}
+
+    # Version of the processing behind the cached data. Bump it whenever a
+    # change alters the data, so that cached data is re-read
+    cache_version = 1
+
     def __init__(self, filepath: str):
         self.filepath = filepath
         self.password = os.getenv("QTRPassword")
-        self._data = self._read_qtr_file(
-            workbook=self._decrypt_workbook(filepath, self.password),
-            sheet_name="Issued Record",
+        # Reuse the processed data of a previous read of the same workbook
+        cache = cache_paths(
+            "qtr", QTRReader.cache_version, ["data"], [filepath], EXCEL_ENGINE
         )
+        cached = read_cache(cache)
+        if cached:
+            (self._data,) = cached
+        else:
+            # Both sheets are read from one handle, so the workbook is parsed once
+            with pd.ExcelFile(
+                self._decrypt_workbook(filepath, self.password), engine=EXCEL_ENGINE
+            ) as workbook:
+                self._data = self._read_qtr_file(
+                    workbook=workbook, sheet_name="Issued Record"
+                )
+            write_cache("qtr", cache, [self._data])
 
     @property
     def data(self) -> pd.DataFrame:
@@ -51,29 +89,40 @@ class QTRReader:
 
         # df["Purity Category"] = df["Item Code"].str.extract(r"(\d{2}) \w+")
 
-        # Format item code
-        df["Item Code"] = (
-            df["Item Code"]
-            .replace(r"(\d{2}) (\w+)", r"\1\2", regex=True)
-            .replace(r"CCH\w?", "CHA", regex=True)
-            .replace(r"CB\w+", "BRA", regex=True)
-            .replace(r"BGL", "BAN", regex=True)
-            .replace("HP\w", "", regex=True)
-            .replace(r"(\d{2})C", r"\1CHA", regex=True)
-            .replace("PSET", "PEN", regex=False)
-            .replace("SCRAP", "", regex=False)
-            .replace("PURE", "", regex=False)
-            .replace("", "UNK", regex=False)
+        # Format item code, once per distinct code. Missing codes (-1) index
+        # the trailing NaN.
+        codes, uniques = pd.factorize(df["Item Code"])
+        formatted = np.array(
+            [*(QTRReader._format_item_code(code) for code in uniques), np.nan],
+            dtype=object,
         )
+        df["Item Code"] = formatted[codes]
 
         return df
 
+    @staticmethod
+    def _format_item_code(code: str) -> str:
+        """
+        Formats a QTR item code to match the Wingold item codes.
+
+        Args:
+            code (str): The item code.
+
+        Returns:
+            str: The formatted item code, "UNK" if nothing remains of it.
+        """
+        for pattern, replacement in QTRReader.item_code_substitutions:
+            code = pattern.sub(replacement, code)
+        return QTRReader.item_code_renames.get(code, code)
+
     def _read_qtr_file(self, workbook, sheet_name: str) -> pd.DataFrame:
         info = self.read_items(workbook)
         df = pd.read_excel(
             workbook,
             sheet_name=sheet_name,
             header=1,
+            # Skip the first row after the header while parsing
+            skiprows=[2],
             usecols="A:F",
             names=[
                 "Date",
@@ -92,32 +141,46 @@ class QTRReader:
                 "Making Value": "float64",
             },
         )
-        # Remove first row
-        df = df.iloc[1:].copy()
-        df["Gross Weight"] = df["Gross Weight"].fillna(0)
-        df["Pure Weight"] = df["Pure Weight"].fillna(0)
-        df["Making Value"] = df["Making Value"].fillna(0)
+        amounts = ["Gross Weight", "Pure Weight", "Making Value"]
+        df[amounts] = df[amounts].fillna(0)
 
         # Associated Rows
-        # Add Item Code and Making Rate from info on Invoice Number
+        # Add Item Code and Making Rate from info on Invoice Number. Only the
+        # first item of each invoice is used, so that an invoice with several
+        # item rows is not repeated (and its weights counted more than once)
         df = df.merge(
-            info[["Invoice Number", "Item Code", "Making Rate"]],
+            info[["Invoice Number", "Item Code", "Making Rate"]].drop_duplicates(
+                "Invoice Number"
+            ),
             on="Invoice Number",
             how="left",
+            validate="m:1",
         )
 
-        # Derived rows
-        df["Purity"] = round(df["Pure Weight"] / df["Gross Weight"], 3)
+        # Derived rows. Rows without a gross weight get a NaN (rather than
+        # inf) purity
+        gross = df["Gross Weight"].to_numpy(dtype=np.float64)
+        pure = df["Pure Weight"].to_numpy(dtype=np.float64)
+        df["Purity"] = np.round(
+            np.divide(pure, gross, out=np.full_like(gross, np.nan), where=gross != 0),
+            3,
+        )
         df["Unit Quantity"] = 1
         df["Transaction Type"] = "SALE"
 
-        # Edge case: Rename customers
-        df["Customer"] = df["Customer"].replace(
-            {
-                "VIVAA": "Vivaa Jewellery Trading LLC",
-                "VIVAA S": "Vivaa Jewellery Trading LLC",
-                "NIMISHA": "Nimisha Jewellers LLC",
-            },
+        # Edge case: Rename customers. Each distinct name is renamed once and
+        # broadcast through the categorical codes (renames may merge names)
+        customers = df["Customer"].astype("category")
+        labels, names = pd.factorize(
+            customers.cat.categories.map(
+                lambda name: QTRReader.customer_names.get(name, name)
+            )
+        )
+        # Missing customers (-1) index the trailing -1, which also holds when
+        # no customer is present at all
+        codes = customers.cat.codes.to_numpy()
+        df["Customer"] = pd.Categorical.from_codes(
+            np.append(labels, -1)[codes], categories=names
         )
 
         # Tag as QTR
@@ -1,12 +1,13 @@
 from typing import List
 from enum import Enum
 import pandas as pd
+import numpy as np
 import subprocess
 import logging
-import os
-import io
 import re
 
+from src.readers.cache import cache_paths, read_cache, write_cache
+
 
 class TransactionType(Enum):
     SALE = 1
@@ -28,6 +29,50 @@ class TransactionType(Enum):
 
 
 class WingoldReader:
+    # Vectorized equivalent of `TransactionType.identify_transaction`
+    transaction_prefixes = {
+        "S": TransactionType.SALE.name,
+        "P": TransactionType.PURCHASE.name,
+        "R": TransactionType.RETURN.name,
+        "D": TransactionType.DIRECT_SALE.name,
+    }
+
+    # Columns read from the tables (the rest are never parsed), and their
+    # dtypes. Weights fit in float32; making rates and values are amounts in
+    # AED, summed over whole years, and Purity is compared for exact values
+    # (e.g. the 0.995 edge case in Sales), so those stay float64.
+    transaction_columns = [
+        "DocNumber",
+        "DocDate",
+        "TaCode",
+        "ItemCode",
+        "Purity",
+        "QtyInPcs",
+        "GrossWt",
+        "PureWt",
+        "MakingRt",
+        "MakingValue",
+    ]
+    transaction_dtypes = {
+        "DocNumber": "string",
+        "DocDate": "string",
+        "TaCode": "string",
+        "ItemCode": "string",
+        "GrossWt": "float32",
+        "PureWt": "float32",
+        "MakingRt": "float64",
+        "MakingValue": "float64",
+    }
+    account_columns = ["TACode", "TAName"]
+    account_dtypes = {"TACode": "string", "TAName": "string"}
+
+    # Version of the processing behind the cached tables. Bump it whenever a
+    # change alters the tables, so that cached ones are re-read
+    cache_version = 1
+
+    # Spellings of "LLC" in account names
+    llc_pattern = re.compile(r"[Ll]\.?[Ll]\.?[Cc]")
+
     def __init__(self, filepath: str):
         """
         Initializes the WingoldReader with the path to the Wingold database file.
@@ -35,11 +80,33 @@ class WingoldReader:
         Args:
             filepath (str): Path to the Wingold .mdb file.
         """
-        # Set up tables
-        self._transactions = self.__read_table(filepath, "BinCard")
-        self._accounts = self.__read_table(filepath, "Party")
-        self.__preprocess()
-        self._sales = self.__extract_sales()
+        # Reuse the processed tables of a previous read of the same database
+        cache = cache_paths(
+            "wingold",
+            WingoldReader.cache_version,
+            ["transactions", "sales"],
+            [filepath],
+        )
+        cached = read_cache(cache)
+        if cached:
+            self._transactions, self._sales = cached
+        else:
+            # Set up tables
+            self._transactions = self.__read_table(
+                filepath,
+                "BinCard",
+                usecols=WingoldReader.transaction_columns,
+                dtype=WingoldReader.transaction_dtypes,
+            )
+            self._accounts = self.__read_table(
+                filepath,
+                "Party",
+                usecols=WingoldReader.account_columns,
+                dtype=WingoldReader.account_dtypes,
+            )
+            self.__preprocess()
+            self._sales = self.__extract_sales()
+            write_cache("wingold", cache, [self._transactions, self._sales])
 
     @property
     def transactions(self) -> pd.DataFrame:
@@ -60,43 +127,40 @@ class WingoldReader:
         Preprocesses the transactions DataFrame to clean and format the data.
         """
         logging.info("Preprocessing transactions...")
-        # Keep only required columns
-        self._transactions = self._transactions[
-            [
-                "DocNumber",
-                "DocDate",
-                "TaCode",
-                "ItemCode",
-                "Purity",
-                "QtyInPcs",
-                "GrossWt",
-                "PureWt",
-                "MakingRt",
-                "MakingValue",
-            ]
-        ]
-
-        # Set transaction type
-        self._transactions["TransactionType"] = self._transactions["DocNumber"].apply(
-            TransactionType.identify_transaction
+        # Set transaction type from the document number's first character
+        self._transactions["TransactionType"] = (
+            self._transactions["DocNumber"]
+            .str[0]
+            .map(WingoldReader.transaction_prefixes)
+            .fillna("Unknown")
+            .astype("category")
         )
 
-        # Datetime conversions
-        self._transactions["DocDate"] = self._transactions["DocDate"].str.replace(
-            "0001", "1971"
+        # Datetime conversions. Each distinct date string is parsed once
+        dates = self._transactions["DocDate"].str.replace("0001", "1971", regex=False)
+        self._transactions["DocDate"] = pd.to_datetime(dates, cache=True)
+        # A stable sort keeps each date's transactions in their table order
+        self._transactions.sort_values(
+            by="DocDate", kind="stable", inplace=True, ignore_index=True
         )
-        self._transactions["DocDate"] = pd.to_datetime(self._transactions["DocDate"])
-        self._transactions.sort_values(by="DocDate", inplace=True)
 
         # Add name from accounts
         self._accounts.rename(
             columns={"TACode": "TaCode"}, inplace=True
         )  # Keep key column uniform
-        self._accounts["TAName"] = self._accounts["TAName"].apply(
-            self.__fix_capitalization
+        self._accounts["TAName"] = [
+            WingoldReader.__fix_capitalization(name)
+            for name in self._accounts["TAName"].tolist()
+        ]
+        # Mapping the categorical codes looks up each distinct code once. As
+        # with a dict, the last account of a duplicated code wins
+        accounts_map = self._accounts.drop_duplicates("TaCode", keep="last").set_index(
+            "TaCode"
+        )["TAName"]
+        self._transactions["TaCode"] = self._transactions["TaCode"].astype("category")
+        self._transactions["TAName"] = (
+            self._transactions["TaCode"].map(accounts_map).astype("category")
         )
-        accounts_map = self._accounts.set_index("TaCode")["TAName"].to_dict()
-        self._transactions["TAName"] = self._transactions["TaCode"].map(accounts_map)
 
         # Mark as non-QTR
         self._transactions["QTR"] = False
@@ -110,44 +174,56 @@ class WingoldReader:
         """
         # ----- Extract Sales Data ----- #
         logging.info("Extracting sales data...")
-        # Convert sales returns to negative values
-        sales_returns = self._transactions[
-            self._transactions.DocNumber.str.startswith("R")
-        ].copy()
-        sales_returns["GrossWt"] = -sales_returns["GrossWt"]
-        sales_returns["PureWt"] = -sales_returns["PureWt"]
-        sales_returns["MakingValue"] = -sales_returns["MakingValue"]
-
-        # Get sales
-        sales = self._transactions[
-            self._transactions.DocNumber.str.startswith("S")
-        ].copy()
-        # Merge with negative sales returns values
-        sales = pd.concat([sales, sales_returns], ignore_index=True)
+        # The transaction type already encodes the document number prefix, and
+        # compares as categorical codes
+        transaction_type = self._transactions["TransactionType"]
+        returns = (transaction_type == TransactionType.RETURN.name).to_numpy()
+        mask = returns | (transaction_type == TransactionType.SALE.name).to_numpy()
+
+        # Select sales and returns in one pass, converting sales returns to
+        # negative values
+        sales = self._transactions.loc[mask].reset_index(drop=True)
+        sign = np.where(returns[mask], -1, 1).astype(np.float32)
+        for col in ["GrossWt", "PureWt", "MakingValue"]:
+            sales[col] = sales[col].to_numpy() * sign
 
         return sales
 
-    def __read_table(self, filepath, table_name: str) -> pd.DataFrame:
+    def __read_table(
+        self,
+        filepath,
+        table_name: str,
+        usecols: List[str] = None,
+        dtype: dict = None,
+    ) -> pd.DataFrame:
         """
         Reads a table from a Microsoft Access database file using mdb-export.
 
         Args:
             filepath (str): Path to the .mdb file.
             table_name (str): Name of the table to read.
+            usecols (List[str], optional): The columns to keep. Defaults to all.
+            dtype (dict, optional): The dtypes of columns, rather than inferring
+                them. Defaults to None.
 
         Returns:
             pd.DataFrame: DataFrame containing the table data.
         """
         logging.info(f"Reading table '{table_name}'")
-        data = subprocess.check_output(["mdb-export", filepath, table_name])
-        return pd.read_csv(io.BytesIO(data))
-
-    def __fix_capitalization(self, name: str):
+        # Parse the export as it streams in, rather than buffering all of it
+        with subprocess.Popen(
+            ["mdb-export", filepath, table_name], stdout=subprocess.PIPE
+        ) as process:
+            df = pd.read_csv(process.stdout, usecols=usecols, dtype=dtype)
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, process.args)
+        return df
+
+    @staticmethod
+    def __fix_capitalization(name: str):
         """
         Fixes the capitalization of a name by capitalizing the first letter of each word.
         """
-        if "V I V A A" in name:
-            name = name.replace("V I V A A", "Vivaa")
+        name = name.replace("V I V A A", "Vivaa")
         name = " ".join(word.capitalize() for word in name.split())
-        name = re.sub(r"[Ll]\.?[Ll]\.?[Cc]", "LLC", name)
-        return name
+        return WingoldReader.llc_pattern.sub("LLC", name)